@@ -1,15 +1,43 @@
 import os
+import asyncio
 import tempfile
-import shutil
 import base64
-import mimetypes
+import hashlib
+import json
+import time
+from contextlib import asynccontextmanager
 from typing import List
 
+import httpx
+from cachetools import LRUCache
 from fastapi import FastAPI, UploadFile, File, Form
+from fastapi.responses import StreamingResponse
 
-from config import client  # your Gemini/OpenAI client
+from config import llm_call, llm_stream, get_http_client, close_clients, BASE_URL
 
-app = FastAPI(title="AI-Powered Dental API")
+WARMUP_CONNECTIONS = 4
+WARMUP_TIMEOUT = 5.0
+
+
+async def warm_up_connection() -> None:
+    try:
+        await get_http_client().head(BASE_URL, timeout=WARMUP_TIMEOUT)
+    except httpx.HTTPError:
+        pass  # warm-up is best effort; real calls surface their own errors
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Open a few TLS sessions up front so the first requests skip the handshake.
+    await asyncio.gather(
+        *(warm_up_connection() for _ in range(WARMUP_CONNECTIONS)),
+        asyncio.to_thread(clear_stale_parts)
+    )
+    yield
+    await close_clients()
+
+
+app = FastAPI(title="AI-Powered Dental API", lifespan=lifespan)
 
 # -------------------
 # Uploads Directory
@@ -17,6 +45,144 @@ app = FastAPI(title="AI-Powered Dental API")
 UPLOAD_DIR = os.path.join(tempfile.gettempdir(), "dental_uploads")
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
+# mkstemp files are 0600; saved uploads get the usual umask-based mode instead.
+_umask = os.umask(0)
+os.umask(_umask)
+UPLOAD_MODE = 0o666 & ~_umask
+# Temp files this old are left over from a crash, not a write in progress.
+STALE_PART_AGE = 3600
+
+# Image types we expect from phones/cameras; anything else is sent as JPEG.
+EXT_MIME = {
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".png": "image/png",
+    ".webp": "image/webp",
+    ".heic": "image/heic",
+}
+
+
+def upload_path(filename: str | None, data: bytes) -> tuple[str, str]:
+    """Content-addressed path for an upload, plus the hash it is named after; run via asyncio.to_thread."""
+    content_hash = hashlib.blake2b(data, digest_size=16).hexdigest()
+    ext = os.path.splitext(filename or "")[1].lower()
+    if not ext[1:].isalnum():
+        ext = ""
+    return os.path.join(UPLOAD_DIR, f"{content_hash}{ext}"), content_hash
+
+
+def save_upload(file_path: str, data: bytes) -> None:
+    """Write already-read upload bytes to disk; run via asyncio.to_thread.
+
+    The bytes go to a temporary file that is renamed into place, so a file at
+    file_path is always complete and an existing one can be reused as-is.
+    """
+    if os.path.exists(file_path):
+        return
+    fd, tmp_path = tempfile.mkstemp(dir=UPLOAD_DIR, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            out.write(data)
+        os.chmod(tmp_path, UPLOAD_MODE)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def clear_stale_parts() -> None:
+    """Remove temp files that a crashed save_upload never renamed; run via asyncio.to_thread."""
+    cutoff = time.time() - STALE_PART_AGE
+    with os.scandir(UPLOAD_DIR) as entries:
+        for entry in entries:
+            if not entry.name.endswith(".part"):
+                continue
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.unlink(entry.path)
+            except FileNotFoundError:
+                pass  # another worker removed it first
+
+
+# -------------------
+# Gemini Vision Calls
+# -------------------
+# Finished analyses keyed by (image hash, symptoms): re-sent photos skip Gemini.
+analysis_cache: LRUCache = LRUCache(maxsize=1024)
+
+
+async def encode_image(data: bytes) -> str:
+    """Base64-encode on a worker thread so multi-MB images don't stall the loop."""
+    return (await asyncio.to_thread(base64.b64encode, data)).decode("ascii")
+
+
+def vision_messages(symptoms: str, mime_type: str, b64_image: str) -> list[dict]:
+    return [
+        {"role": "system", "content": "You are a dental AI assistant. Summarize dental issues from photos."},
+        {"role": "user", "content": [
+            {"type": "text", "text": f"Patient symptoms: {symptoms}"},
+            {"type": "image_url", "image_url": {"url": f"data:{mime_type};base64,{b64_image}"}}
+        ]}
+    ]
+
+
+async def analyze_image(symptoms: str, mime_type: str, data: bytes, content_hash: str) -> str:
+    """Run one vision request for a single image, reusing a cached result if present."""
+    key = (content_hash, symptoms)
+    cached = analysis_cache.get(key)
+    if cached:
+        return cached
+
+    response = await llm_call(
+        model="gemini-2.0-flash",
+        messages=vision_messages(symptoms, mime_type, await encode_image(data))
+    )
+    analysis = response.choices[0].message.content
+    if analysis:  # an empty answer (e.g. a safety stop) is not worth pinning
+        analysis_cache[key] = analysis
+    return analysis
+
+
+async def stream_image(symptoms: str, mime_type: str, data: bytes, content_hash: str):
+    """Streaming analyze_image: yields text deltas and caches the full answer at the end."""
+    key = (content_hash, symptoms)
+    cached = analysis_cache.get(key)
+    if cached:
+        yield cached
+        return
+
+    parts = []
+    async for delta in llm_stream(
+        model="gemini-2.0-flash",
+        messages=vision_messages(symptoms, mime_type, await encode_image(data))
+    ):
+        parts.append(delta)
+        yield delta
+    analysis = "".join(parts)
+    if analysis:  # same rule as analyze_image: never cache an empty answer
+        analysis_cache[key] = analysis
+
+
+def sse(payload) -> str:
+    # JSON-encode so newlines in model output cannot break SSE framing.
+    return f"data: {json.dumps(payload)}\n\n"
+
+
+async def analysis_events(symptoms: str, saved_files: list[str], images: list[tuple], writes):
+    """SSE body for a streamed /analyze. Images are streamed one after another."""
+    yield sse({"saved_files": saved_files, "symptoms": symptoms})
+    try:
+        try:
+            for filename, mime_type, data, content_hash in images:
+                async for delta in stream_image(symptoms, mime_type, data, content_hash):
+                    yield sse({"file": filename, "delta": delta})
+        finally:
+            # Always collect the writes so a failed save is never silently dropped.
+            await writes
+    except Exception as e:
+        yield sse({"error": str(e)})
+    yield "data: [DONE]\n\n"
+
 
 # -------------------
 # Analyze Endpoint
@@ -24,48 +190,67 @@ os.makedirs(UPLOAD_DIR, exist_ok=True)
 @app.post("/analyze")
 async def analyze(
     symptoms: str = Form(""),
-    files: List[UploadFile] = File(None)
+    files: List[UploadFile] = File(None),
+    stream: bool = Form(False)
 ):
     try:
         saved_files = []
-        user_content = [{"type": "text", "text": f"Patient symptoms: {symptoms}"}]
+        images = []
+        pending_writes = []
 
         if files:
             for file in files:
-                file_path = os.path.join(UPLOAD_DIR, file.filename)
+                data = await file.read()
+                # Hashing a multi-MB upload is CPU work; keep it off the loop.
+                file_path, content_hash = await asyncio.to_thread(upload_path, file.filename, data)
+                pending_writes.append(asyncio.to_thread(save_upload, file_path, data))
 
-                with open(file_path, "wb") as buffer:
-                    shutil.copyfileobj(file.file, buffer)
-
-                mime_type, _ = mimetypes.guess_type(file_path)
-                if not mime_type:
-                    mime_type = "image/jpeg"
-
-                with open(file_path, "rb") as f:
-                    b64_image = base64.b64encode(f.read()).decode("utf-8")
-
-                user_content.append({
-                    "type": "image_url",
-                    "image_url": {"url": f"data:{mime_type};base64,{b64_image}"}
-                })
+                mime_type = EXT_MIME.get(os.path.splitext(file_path)[1], "image/jpeg")
 
+                images.append((file.filename, mime_type, data, content_hash))
                 saved_files.append(file_path)
 
         if not saved_files:
             return {"error": "Please upload at least one image."}
 
-        response = await client.chat.completions.create(
-            model="gemini-2.0-flash",
-            messages=[
-                {"role": "system", "content": "You are a dental AI assistant. Summarize dental issues from photos."},
-                {"role": "user", "content": user_content}
-            ]
+        if stream:
+            # Start the disk writes now; the event stream awaits them before closing.
+            writes = asyncio.gather(*pending_writes)
+            return StreamingResponse(
+                analysis_events(symptoms, saved_files, images, writes),
+                media_type="text/event-stream"
+            )
+
+        # One Gemini call per image, run concurrently with each other and with the disk writes.
+        results = await asyncio.gather(
+            *(
+                analyze_image(symptoms, mime_type, data, content_hash)
+                for _, mime_type, data, content_hash in images
+            ),
+            *pending_writes,
+            return_exceptions=True
         )
+        summaries, write_results = results[:len(images)], results[len(images):]
+        for result in write_results:
+            if isinstance(result, BaseException):
+                raise result
+
+        # A failed image is reported in place so it doesn't hide the others' results.
+        if all(isinstance(summary, BaseException) for summary in summaries):
+            raise summaries[0]
+        if len(summaries) == 1:
+            analysis = summaries[0]
+        else:
+            analysis = "\n\n".join(
+                f"{filename}:\nError: {summary}" if isinstance(summary, BaseException)
+                else f"{filename}:\n{summary}"
+                for (filename, *_), summary in zip(images, summaries)
+            )
 
         return {
             "saved_files": saved_files,
             "symptoms": symptoms,
-            "analysis": response.choices[0].message.content   # ✅ fixed
+            "analysis": analysis
         }
 
     except Exception as e:
@@ -1,10 +1,13 @@
 import asyncio
+import re
+from cachetools import LRUCache
 from pydantic import BaseModel
-from config import client, model_name  # make sure you have your OpenAI client configured
+from config import get_client, llm_call, model_name  # make sure you have your OpenAI client configured
 from agents import (
     Agent,
     Runner,
     OpenAIChatCompletionsModel,
+    RunConfig,
     function_tool,
     set_tracing_disabled,
 )
@@ -67,43 +70,54 @@ CORE_CONTENT = {
 }
 
 # -------------------
-# Tools
-# -------------------
-@function_tool
-def get_condition_info(condition_name: str) -> str:
-    conditions = CORE_CONTENT["conditions"]
-    condition = conditions.get(condition_name.lower())
-    if not condition:
-        return DotFormatter.format_list([
-            f"I only know these conditions: {', '.join(conditions.keys())}",
-            "Pick one!"
-        ])
-    return DotFormatter.format_list([
-        f"{condition_name.title()}",
+# Precomputed Replies
+# -------------------
+# CORE_CONTENT never changes at runtime, so the tool replies are formatted once.
+OVERVIEW_TEXT = DotFormatter.format_numbered(CORE_CONTENT["overview"])
+CONDITION_LIST_TEXT = DotFormatter.format_list(["Conditions I can check:"] + list(CORE_CONTENT["conditions"].keys()))
+UNKNOWN_CONDITION_TEXT = DotFormatter.format_list([
+    f"I only know these conditions: {', '.join(CORE_CONTENT['conditions'].keys())}",
+    "Pick one!"
+])
+CONDITION_INFO_TEXT = {
+    name: DotFormatter.format_list([
+        f"{name.title()}",
         f"Purpose: {condition['purpose']}",
         f"How to use: {condition['how_to_use']}",
         f"Benefits: {condition['benefits']}"
     ])
+    for name, condition in CORE_CONTENT["conditions"].items()
+}
+FAQ_ANSWER_TEXT = {k: DotFormatter.format_list([v]) for k, v in CORE_CONTENT["faqs"].items()}
+# Every FAQ key in one alternation: a single scan of the question finds any of them.
+# Word boundaries keep "what is this appointment" from matching "what is this app".
+FAQ_PATTERN = re.compile(r"\b(?:" + "|".join(re.escape(k) for k in FAQ_ANSWER_TEXT) + r")\b")
+FAQ_FALLBACK_TEXT = DotFormatter.format_list([
+    "I only answer questions about dental conditions and app usage.",
+    "Try asking about gum infection, tooth decay, or sensitivity."
+])
+
+# -------------------
+# Tools
+# -------------------
+@function_tool
+def get_condition_info(condition_name: str) -> str:
+    return CONDITION_INFO_TEXT.get(condition_name.lower(), UNKNOWN_CONDITION_TEXT)
 
 @function_tool
 def get_overview() -> str:
-    return DotFormatter.format_numbered(CORE_CONTENT["overview"])
+    return OVERVIEW_TEXT
 
 @function_tool
 def list_conditions() -> str:
-    return DotFormatter.format_list(["Conditions I can check:"] + list(CORE_CONTENT["conditions"].keys()))
+    return CONDITION_LIST_TEXT
 
 @function_tool
 def answer_faq(question: str) -> str:
-    faqs = CORE_CONTENT["faqs"]
-    q = question.lower().strip()
-    for k, v in faqs.items():
-        if k in q:
-            return DotFormatter.format_list([v])
-    return DotFormatter.format_list([
-        "I only answer questions about dental conditions and app usage.",
-        "Try asking about gum infection, tooth decay, or sensitivity."
-    ])
+    match = FAQ_PATTERN.search(question.lower())
+    if match:
+        return FAQ_ANSWER_TEXT[match.group(0)]
+    return FAQ_FALLBACK_TEXT
 
 # -------------------
 # Dental AI Agent
@@ -117,29 +131,55 @@ dental_agent = Agent(
         "Stick to gum infection, tooth decay, and sensitivity.\n"
         "Use dot or numbered list style for clarity."
     ),
-    model=OpenAIChatCompletionsModel(model=model_name, openai_client=client),
     tools=[get_condition_info, get_overview, list_conditions, answer_faq],
     output_type=MessageOutput,
 )
 
+def dental_run_config() -> RunConfig:
+    # Resolved per run so importing app.py never builds the Gemini client.
+    return RunConfig(model=OpenAIChatCompletionsModel(model=model_name, openai_client=get_client()))
+
+# -------------------
+# Response Cache
+# -------------------
+# Answers keyed by normalized query, so repeats like "Tell me about tooth decay?"
+# and "tell me about tooth decay" skip the agent run entirely.
+response_cache: LRUCache = LRUCache(maxsize=5000)
+
+def normalize_query(query: str) -> str:
+    return " ".join(re.sub(r"[^\w\s]", " ", query.lower()).split())
+
 # -------------------
 # Runner
 # -------------------
 async def run_dental_agent(query: str) -> str:
+    key = normalize_query(query)
+    # Questions CORE_CONTENT answers verbatim never need a Gemini round-trip.
+    # Only whole-query matches short-circuit; anything longer goes to the agent,
+    # which can still call answer_faq for looser matches.
+    if key in FAQ_ANSWER_TEXT:
+        return FAQ_ANSWER_TEXT[key]
+    if key in CONDITION_INFO_TEXT:
+        return CONDITION_INFO_TEXT[key]
+    cached = response_cache.get(key)
+    if cached is not None:
+        return cached
+    run_config = dental_run_config()  # a missing API key surfaces here, not as a fallback answer
     try:
-        result = await Runner.run(dental_agent, query)
+        result = await Runner.run(dental_agent, query, run_config=run_config)
         response = result.final_output.response
         if not response.strip():
-            return get_overview()
+            return OVERVIEW_TEXT
+        response_cache[key] = response
         return response
     except Exception:
-        return get_overview()
+        return OVERVIEW_TEXT
 
 # -------------------
 # Image Analysis Helper
 # -------------------
 async def analyze_dental_image(image_url: str, symptoms: str = "") -> str:
-    response = await client.chat.completions.create(
+    response = await llm_call(
         model="gemini-2.0-flash",
         messages=[
             {"role": "system", "content": "You are a dental AI assistant. Analyze teeth images for possible issues."},
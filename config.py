@@ -1,16 +1,132 @@
 import os
+import asyncio
+from contextlib import asynccontextmanager
+from functools import lru_cache
+
+import httpx
 from dotenv import load_dotenv
-from openai import AsyncOpenAI
+from openai import AsyncOpenAI, APIConnectionError, APIStatusError
 
-# Load environment variables
-load_dotenv()
+# Settings read from the environment; .env is parsed only if one is not exported
+ENV_SETTINGS = ("GEMINI_API_KEY", "LLM_CONCURRENCY")
+if not all(name in os.environ for name in ENV_SETTINGS):
+    load_dotenv()  # exported values still take precedence over .env
 
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-if not GEMINI_API_KEY:
-    raise ValueError("GEMINI_API_KEY missing in .env file!")
 
 model_name = "gemini-2.0-flash"
 BASE_URL = "https://generativelanguage.googleapis.com/v1beta/openai/"
 
-# LLM client
-client = AsyncOpenAI(base_url=BASE_URL, api_key=GEMINI_API_KEY)
\ No newline at end of file
+# Shared HTTP pool so /analyze and the agent reuse keep-alive TLS sessions
+@lru_cache
+def get_http_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=2000, max_keepalive_connections=1500),
+        timeout=httpx.Timeout(120.0),
+    )
+
+
+# LLM client, built on first use so importing config has no side effects
+@lru_cache
+def get_client() -> AsyncOpenAI:
+    if not GEMINI_API_KEY:
+        raise ValueError("GEMINI_API_KEY missing in .env file!")
+    return AsyncOpenAI(base_url=BASE_URL, api_key=GEMINI_API_KEY, http_client=get_http_client())
+
+
+# Caps in-flight Gemini requests so bursts stay under the provider's RPM
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "8"))
+LLM_RETRIES = 3
+
+
+# Built lazily, like the clients, so each lifespan's event loop gets its own
+@lru_cache
+def get_llm_semaphore() -> asyncio.Semaphore:
+    return asyncio.Semaphore(LLM_CONCURRENCY)
+
+
+@lru_cache
+def get_llm_client() -> AsyncOpenAI:
+    # The wrappers below own the retry policy; SDK retries would multiply it
+    # and sleep while holding the semaphore.
+    return get_client().with_options(max_retries=0)
+
+
+def is_retryable(error: Exception) -> bool:
+    """Same cases the SDK retries: connection errors, 408, 409, 429 and 5xx."""
+    if isinstance(error, APIConnectionError):
+        return True
+    return isinstance(error, APIStatusError) and (
+        error.status_code in (408, 409, 429) or error.status_code >= 500
+    )
+
+
+async def close_clients() -> None:
+    """Close the pool and drop the cached clients and semaphore so a restarted lifespan builds fresh ones."""
+    await get_http_client().aclose()
+    get_client.cache_clear()
+    get_llm_client.cache_clear()
+    get_http_client.cache_clear()
+    get_llm_semaphore.cache_clear()
+
+
+@asynccontextmanager
+async def llm_request(**kwargs):
+    """chat.completions.create behind the shared semaphore, with exponential backoff.
+
+    The semaphore slot is held until the with-block exits, so a stream can be read under it.
+    """
+    for attempt in range(LLM_RETRIES):
+        async with get_llm_semaphore():
+            try:
+                response = await get_llm_client().chat.completions.create(**kwargs)
+            except (APIConnectionError, APIStatusError) as e:
+                if attempt == LLM_RETRIES - 1 or not is_retryable(e):
+                    raise
+            else:
+                yield response
+                return
+        await asyncio.sleep(2 ** attempt)
+
+
+async def llm_call(**kwargs):
+    """A single chat completion through llm_request."""
+    async with llm_request(**kwargs) as response:
+        return response
+
+
+# Deltas buffered per stream; a full Gemini answer fits, so a slow SSE reader
+# never keeps the upstream request (and its semaphore slot) open.
+STREAM_BUFFER = 4096
+_STREAM_END = object()
+
+
+async def _pump_stream(queue: asyncio.Queue, kwargs: dict) -> None:
+    """Read one Gemini stream into queue under the semaphore, then release it."""
+    try:
+        async with llm_request(stream=True, **kwargs) as stream:
+            async with stream:
+                async for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        await queue.put(chunk.choices[0].delta.content)
+    except Exception as e:
+        await queue.put(e)
+    else:
+        await queue.put(_STREAM_END)
+
+
+async def llm_stream(**kwargs):
+    """Streaming llm_call: yields content deltas as they arrive from Gemini.
+
+    A background task reads the upstream stream into a buffer, so the
+    semaphore slot is freed when Gemini finishes, not when the caller does.
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=STREAM_BUFFER)
+    pump = asyncio.create_task(_pump_stream(queue, kwargs))
+    try:
+        while (item := await queue.get()) is not _STREAM_END:
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        pump.cancel()  # caller stopped early: drop the upstream request